@@ -7,5 +7,5 @@ class Document(SQLModel, table=True):
     filename: str
     uploaded_at: datetime.datetime = Field(default_factory=datetime.datetime.utcnow)
     metadata: Optional[dict] = Field(default_factory=dict, sa_column=JSON)
-    # full_text is concatenated pages with special markers, but we also store pages separately in metadata
+    # full_text is concatenated pages with special markers; metadata["page_offsets"] holds where each page starts
     full_text: str
\ No newline at end of file
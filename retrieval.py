@@ -0,0 +1,155 @@
+import re
+import threading
+from array import array
+from typing import List, Tuple, Dict, Any
+import numpy as np
+from scipy.sparse import csr_matrix
+
+_token_re = re.compile(r"\w+")
+_sentence_re = re.compile(r"[^.!?]+[.!?]*")
+_clause_re = re.compile(r"[^;:]+[;:]?")
+
+def _make_token_table() -> bytes:
+    # byte -> itself for word characters (A-Z lowercased), space for everything else
+    table = bytearray(b" " * 256)
+    for c in b"abcdefghijklmnopqrstuvwxyz0123456789_":
+        table[c] = c
+    for c in b"ABCDEFGHIJKLMNOPQRSTUVWXYZ":
+        table[c] = c + 32
+    return bytes(table)
+
+_TOKEN_TABLE = _make_token_table()
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased \\w+ tokens of text."""
+    if text.isascii():
+        # one table lookup per byte and a whitespace split, both in C; same tokens as the regex
+        return text.encode("ascii").translate(_TOKEN_TABLE).decode("ascii").split()
+    return _token_re.findall(text.lower())
+
+def split_sentences(text: str) -> List[Tuple[str, int]]:
+    """Return (sentence, start_char) pairs for a page of text."""
+    out = []
+    for m in _sentence_re.finditer(text):
+        s = m.group(0)
+        stripped = s.strip()
+        if stripped:
+            out.append((stripped, m.start() + len(s) - len(s.lstrip())))
+    return out
+
+class SimpleRetriever:
+    """
+    In-memory BM25 index over the sentences of every ingested page.
+    Sentences are rows of a sparse (n_sentences x vocab) float32 matrix of BM25 term
+    weights, so a query is scored with a single sparse matrix-vector product. Documents can be added
+    incrementally; the weighted matrix is rebuilt lazily on the next query.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # one entry per indexed sentence: {doc_id, page, start, sentence}
+        self._sentences: List[Dict[str, Any]] = []
+        self._vocab: Dict[str, int] = {}
+        # raw term frequencies in CSR layout, one row per sentence; typed arrays keep each
+        # posting at 6 bytes instead of two boxed ints in a list
+        self._indices = array("i")
+        self._tfs = array("H")
+        self._indptr = array("i", [0])
+        # term_id -> number of sentences containing it
+        self._df = array("i")
+        self._doc_len = array("i")
+        self._X = None
+
+    def index_documents(self, pages_map: Dict[int, List[str]]):
+        """Rebuild the index from scratch for {doc_id: [page_text, ...]}."""
+        with self._lock:
+            self._reset()
+        self.add_documents(pages_map)
+
+    def add_documents(self, delta: Dict[int, List[str]]):
+        """Index only the given {doc_id: [page_text, ...]}, keeping what is already indexed."""
+        with self._lock:
+            for doc_id, pages in delta.items():
+                for page_no, text in enumerate(pages, start=1):
+                    for sentence, start in split_sentences(text):
+                        tokens = tokenize(sentence)
+                        if not tokens:
+                            continue
+                        self._sentences.append({"doc_id": doc_id, "page": page_no, "start": start, "sentence": sentence})
+                        tf: Dict[int, int] = {}
+                        for t in tokens:
+                            tid = self._vocab.get(t)
+                            if tid is None:
+                                tid = self._vocab[t] = len(self._vocab)
+                                self._df.append(0)
+                            tf[tid] = tf.get(tid, 0) + 1
+                        for tid, c in tf.items():
+                            self._indices.append(tid)
+                            # BM25 saturates long before this, clamping only keeps it in uint16
+                            self._tfs.append(min(c, 0xFFFF))
+                            self._df[tid] += 1
+                        self._indptr.append(len(self._indices))
+                        self._doc_len.append(len(tokens))
+            # idf and average length changed, weights have to be recomputed
+            self._X = None
+
+    def _build(self) -> csr_matrix:
+        k1, b = self.k1, self.b
+        n = len(self._sentences)
+        # np.array copies from the buffers: a live view would stop the arrays from growing
+        indices = np.array(self._indices, dtype=np.int32)
+        indptr = np.array(self._indptr, dtype=np.int32)
+        tf = np.array(self._tfs, dtype=np.float64)
+        df = np.array(self._df, dtype=np.float64)
+        dl = np.array(self._doc_len, dtype=np.float64)
+        idf = np.log(1 + (n - df + 0.5) / (df + 0.5))
+        norm = np.repeat(k1 * (1 - b + b * dl / dl.mean()), np.diff(indptr))
+        # float32 with idf folded in: half the size of float64, and the same dtype as the
+        # query vector so scipy multiplies without casting the matrix on every query
+        data = (idf[indices] * tf * (k1 + 1) / (tf + norm)).astype(np.float32)
+        return csr_matrix((data, indices, indptr), shape=(n, len(self._vocab)))
+
+    def _matrix(self) -> csr_matrix:
+        with self._lock:
+            if self._X is None:
+                self._X = self._build()
+            return self._X
+
+    def retrieve(self, query: str, topk: int = 5) -> List[Dict[str, Any]]:
+        """Return up to topk sentences ranked by BM25 score against the query."""
+        cols = [self._vocab[t] for t in set(tokenize(query)) if t in self._vocab]
+        if not cols:
+            return []
+        X = self._matrix()
+        q = np.zeros(X.shape[1], dtype=np.float32)
+        q[cols] = 1.0
+        scores = X @ q
+        k = min(topk, len(scores))
+        top = np.argpartition(scores, -k)[-k:]
+        top = top[np.argsort(-scores[top])]
+        return [dict(self._sentences[i], score=float(scores[i])) for i in top if scores[i] > 0]
+
+def extract_answer_span(sentence: str, question: str) -> Tuple[str, int, int]:
+    """
+    Pick the clause of the sentence sharing most terms with the question.
+    Returns (text, start, end) with offsets relative to the sentence.
+    """
+    q_terms = set(tokenize(question))
+    best = (sentence, 0, len(sentence))
+    best_overlap = -1
+    for m in _clause_re.finditer(sentence):
+        clause = m.group(0)
+        text = clause.strip()
+        if not text:
+            continue
+        overlap = len(q_terms.intersection(tokenize(text)))
+        if overlap > best_overlap:
+            start = m.start() + len(clause) - len(clause.lstrip())
+            best = (text, start, start + len(text))
+            best_overlap = overlap
+    return best
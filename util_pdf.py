@@ -1,16 +1,70 @@
 import fitz  # pymupdf
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Any, Optional
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import multiprocessing
+import os
 import re
+import threading
+
+# default "text" flags minus ligature preservation: ligatures come out as plain letters,
+# which is what the keyword heuristics match on anyway
+_TEXT_FLAGS = fitz.TEXTFLAGS_TEXT & ~fitz.TEXT_PRESERVE_LIGATURES
+# pages handed to one worker task
+_PAGES_PER_TASK = 16
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: forking the threaded server process could hand a worker locks
+            # held by other threads, which it would then wait on forever
+            _pool = ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+def shutdown_pool():
+    """Stop the extraction worker processes, if any were started."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
 
 def extract_pages_from_pdf(path: str) -> List[str]:
     """Return list of page texts (one string per page)."""
-    doc = fitz.open(path)
     pages = []
-    for p in doc:
-        text = p.get_text("text")
-        pages.append(text)
+    with fitz.open(path) as doc:
+        for p in doc:
+            text = p.get_text("text", flags=_TEXT_FLAGS, sort=False)
+            pages.append(text)
     return pages
 
+def _extract_page_range(path: str, start: int, stop: int) -> List[str]:
+    # fitz Documents can't be pickled, so each worker opens its own handle
+    with fitz.open(path) as doc:
+        return [doc[i].get_text("text", flags=_TEXT_FLAGS, sort=False) for i in range(start, stop)]
+
+def _page_count(path: str) -> int:
+    with fitz.open(path) as doc:
+        return doc.page_count
+
+async def extract_pages_parallel(paths: List[str]) -> List[List[str]]:
+    """
+    Like extract_pages_from_pdf for each path, with all MuPDF work done in worker processes:
+    PyMuPDF isn't thread-safe, and processes give small files real parallelism too.
+    Large PDFs are split into page ranges across workers.
+    """
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    counts = await asyncio.gather(*[loop.run_in_executor(pool, _page_count, p) for p in paths])
+    per_file = [asyncio.gather(*[loop.run_in_executor(pool, _extract_page_range, p, i, min(i + _PAGES_PER_TASK, n))
+                                 for i in range(0, n, _PAGES_PER_TASK)])
+                for p, n in zip(paths, counts)]
+    results = await asyncio.gather(*per_file)
+    return [[page for chunk in chunks for page in chunk] for chunks in results]
+
 # Heuristic extraction helpers:
 
 _date_re = re.compile(r"\b(?:Effective Date|Effective as of|Effective)\s*[:\-]?\s*(\w+\s+\d{1,2},\s*\d{4}|\d{1,2}/\d{1,2}/\d{2,4})", re.I)
@@ -20,6 +74,73 @@ _indemnity_re = re.compile(r"\bindemnif(y|ies|ication)|hold harmless\b", re.I)
 _liability_unlimited_re = re.compile(r"\bunlimited liability\b", re.I)
 _liability_cap_re = re.compile(r"\blimit(ed)? (liability )?(to )?\s*(USD|\$|EUR|INR|Rs\.?)?[\s]*([0-9\.,]+)", re.I)
 _confidentiality_re = re.compile(r"\b(confidential|confidentiality|non-?disclos)\b", re.I)
+_between_re = re.compile(r"\b(this (agreement|contract) (is )?(made )?between|between)\b", re.I)
+_signature_re = re.compile(r"signed|signature|sign(?:ed)? by", re.I)
+
+# audit keyword groups, matched on ASCII-lowercased UTF-8 bytes
+_AUDIT_TERMS = {
+    "auto_renew": (b"auto-renew", b"auto renew", b"renew automatically"),
+    "unlimited_liability": (b"unlimited liability", b"no limit"),
+    "indemnity": (b"indemnif", b"hold harmless"),
+}
+_ASCII_LOWER = bytes.maketrans(b"ABCDEFGHIJKLMNOPQRSTUVWXYZ", b"abcdefghijklmnopqrstuvwxyz")
+# the number has to follow "notice" within this many bytes, on the same line
+_NOTICE_WINDOW = 100
+# anchored right after "notice"; \xc2\xa0 is a UTF-8 non-breaking space, common in PDF text
+_notice_days_re = re.compile(rb"[^\n]*?(\d{1,3})(?:\s|\xc2\xa0)*days?")
+
+def lower_ascii(text: str) -> bytes:
+    """UTF-8 encode text and lowercase A-Z only; byte offsets stay those of the encoded text."""
+    return text.encode("utf-8").translate(_ASCII_LOWER)
+
+def _match_audit_terms(buf: bytes, hits: Dict[str, bool]):
+    # bytes.__contains__ stays in C (memchr/two-way search) with no Unicode lowercasing
+    for name, terms in _AUDIT_TERMS.items():
+        if not hits[name] and any(t in buf for t in terms):
+            hits[name] = True
+
+def scan_audit_terms(pages: List[str]) -> Dict[str, bool]:
+    """Return {group: found} for the audit keyword groups, scanning each page once."""
+    hits = {name: False for name in _AUDIT_TERMS}
+    for p in pages:
+        _match_audit_terms(lower_ascii(p), hits)
+        if all(hits.values()):
+            break
+    return hits
+
+def find_notice_period(buf: bytes) -> Optional[Tuple[int, int, int]]:
+    """
+    Find the first "notice ... N days" phrase in ASCII-lowercased bytes.
+    Returns (N, start, end) as byte offsets, or None.
+    """
+    # bytes.find jumps between "notice" hits and the regex only looks at a bounded window after
+    # each one, so there is no unbounded ".*?" backtracking over adversarial text
+    i = 0
+    while True:
+        j = buf.find(b"notice", i)
+        if j < 0:
+            return None
+        m = _notice_days_re.match(buf, j + 6, j + 6 + _NOTICE_WINDOW)
+        if m:
+            return int(m.group(1)), j, m.end()
+        i = j + 6
+
+def compute_audit_features(pages: List[str]) -> Dict[str, Any]:
+    """Everything /audit needs for a document: keyword hits plus the first notice period and its context."""
+    features = scan_audit_terms(pages)
+    features["notice_days"] = None
+    features["notice_snippet"] = None
+    if features["auto_renew"]:
+        for p in pages:
+            raw = p.encode("utf-8")
+            # translate keeps byte offsets, so they index into raw as well
+            found = find_notice_period(raw.translate(_ASCII_LOWER))
+            if found:
+                days, start, end = found
+                features["notice_days"] = days
+                features["notice_snippet"] = raw[max(start - 80, 0):end + 80].decode("utf-8", "ignore")
+                break
+    return features
 
 def heuristic_extract(pages: List[str]) -> Dict[str, any]:
     joined = "\n".join(pages[:8])  # check first few pages for core metadata
@@ -49,9 +170,8 @@ def heuristic_extract(pages: List[str]) -> Dict[str, any]:
         out["liability_cap"] = {"amount": amount_f, "currency": currency.strip()}
     # Parties heuristic - simple: look for "Between" or "This Agreement is between"
     parties = []
-    between_re = re.compile(r"\b(this (agreement|contract) (is )?(made )?between|between)\b", re.I)
     for i,p in enumerate(pages[:3]):
-        if between_re.search(p):
+        if _between_re.search(p):
             # try to capture lines after
             lines = [l.strip() for l in p.splitlines() if l.strip()]
             if len(lines) >= 3:
@@ -63,7 +183,7 @@ def heuristic_extract(pages: List[str]) -> Dict[str, any]:
     for p in pages[-3:]:
         lines = [l.strip() for l in p.splitlines() if l.strip()]
         for i,l in enumerate(lines):
-            if re.search(r"signed|signature|sign(?:ed)? by", l, re.I):
+            if _signature_re.search(l):
                 # gather nearby lines
                 nearby = lines[i:i+4]
                 signatories.extend(nearby)